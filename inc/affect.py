@@ -0,0 +1,356 @@
+import os
+import re
+import json
+import queue
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import ollama
+
+AFFECT_LOG = "inc/logs/vireya_affect_log.jsonl"
+
+## ----------------- Lexicon Scoring ----------------- ##
+# word: (valence -1..1, arousal 0..1)
+AFFECT_LEXICON = {
+    "happy": (0.8, 0.6), "glad": (0.7, 0.4), "good": (0.6, 0.3), "great": (0.8, 0.6),
+    "calm": (0.5, 0.1), "relaxed": (0.6, 0.1), "proud": (0.7, 0.5), "grateful": (0.8, 0.3),
+    "hopeful": (0.6, 0.4), "excited": (0.7, 0.9), "love": (0.8, 0.6), "fine": (0.3, 0.2),
+    "okay": (0.2, 0.2), "ok": (0.2, 0.2), "rested": (0.5, 0.2), "laugh": (0.7, 0.6),
+    "funny": (0.6, 0.5), "better": (0.5, 0.3), "safe": (0.5, 0.2), "thanks": (0.5, 0.3),
+    "sad": (-0.7, 0.3), "tired": (-0.4, 0.1), "exhausted": (-0.6, 0.2), "drained": (-0.6, 0.1),
+    "angry": (-0.7, 0.9), "mad": (-0.6, 0.8), "furious": (-0.9, 1.0), "frustrated": (-0.6, 0.7),
+    "anxious": (-0.6, 0.8), "worried": (-0.5, 0.7), "scared": (-0.7, 0.9), "afraid": (-0.7, 0.8),
+    "stressed": (-0.6, 0.8), "numb": (-0.6, 0.1), "empty": (-0.7, 0.1), "lonely": (-0.7, 0.2),
+    "alone": (-0.5, 0.2), "hopeless": (-0.9, 0.2), "worthless": (-0.9, 0.3), "guilty": (-0.6, 0.5),
+    "ashamed": (-0.7, 0.5), "bad": (-0.5, 0.4), "awful": (-0.8, 0.6), "terrible": (-0.8, 0.6),
+    "hate": (-0.8, 0.8), "hurt": (-0.6, 0.5), "pain": (-0.6, 0.6), "cry": (-0.6, 0.5),
+    "crying": (-0.6, 0.5), "nightmares": (-0.7, 0.7), "overwhelmed": (-0.7, 0.8), "burned": (-0.5, 0.4),
+    "sick": (-0.5, 0.3), "depressed": (-0.8, 0.2), "miserable": (-0.8, 0.4), "tense": (-0.4, 0.7),
+}
+
+NEGATIONS = {"not", "no", "never", "don't", "dont", "isn't", "isnt", "wasn't", "wasnt", "can't", "cant", "ain't", "aint"}
+INTENSIFIERS = {"very": 1.5, "really": 1.4, "so": 1.3, "extremely": 1.8, "super": 1.5, "kinda": 0.6, "slightly": 0.5, "little": 0.6}
+
+# Words that end a clause, so a negation in one clause can't flip a word in the next.
+CLAUSE_BREAKS = {".", "!", "?", ";", ":", ",", "but"}
+
+# Phrases worth surfacing for follow-up; grouped so the wellness trend can count categories.
+# Kept to intent wording so everyday speech ("I hurt myself at the gym", "going to die of
+# embarrassment", "my words hurt her feelings") isn't flagged.
+RISK_PATTERNS = {
+    "self_harm": (
+        r"\b(kill(ing)? myself|end(ing)? (it all|my life)|suicid\w*|self[- ]harm"
+        r"|(want(ed)?|going|trying|tried|urge) to (hurt|harm|cut) myself|(cutting|harming) myself"
+        r"|(want(ed)? to|wanna) die(?!\s+(of|from|laughing|when|if))|wish (i was|i were|i'?d) dead"
+        r"|(don'?t|do not|didn'?t) want to (live|be alive|be here( anymore)?|wake up))\b"
+    ),
+    "hopelessness": r"\b(no (point|reason) (in )?(living|going on)|better off without me|can'?t go on|give up on (everything|life))\b",
+    "harm_to_others": (
+        r"\b((want|wanted|going|gonna|planning|plan|thinking about|about) to (hurt|kill|shoot|stab)"
+        r" (him|her|them|someone|somebody|everyone|my \w+)|gonna (hurt|kill) (him|her|them|someone|somebody))\b"
+    ),
+    "substance": r"\b(drink(ing)? (too much|every night|to sleep)|blackout|pills to (sleep|cope))\b",
+}
+_RISK_REGEX = {flag: re.compile(pattern, re.IGNORECASE) for flag, pattern in RISK_PATTERNS.items()}
+_TOKEN_REGEX = re.compile(r"[a-z']+|[.!?;:,]")
+
+def _normalize(text):
+    # Phone and browser keyboards often send curly apostrophes ("can’t").
+    return text.replace("\u2019", "'").replace("\u2018", "'")
+
+def _sentiment_label(valence):
+    if valence >= 0.15:
+        return "positive"
+    if valence <= -0.15:
+        return "negative"
+    return "neutral"
+
+def score_text(text):
+    """Fast local lexicon score: sentiment, valence/arousal and risk-language flags."""
+    text = _normalize(text)
+    tokens = _TOKEN_REGEX.findall(text.lower())
+    valences, arousals = [], []
+
+    for i, token in enumerate(tokens):
+        if token not in AFFECT_LEXICON:
+            continue
+        valence, arousal = AFFECT_LEXICON[token]
+        # Look back up to 3 words for a negation, stopping at the previous emotion word or the
+        # end of the previous clause so "not happy, really exhausted" doesn't flip "exhausted".
+        negated = False
+        for w in reversed(tokens[max(0, i - 3):i]):
+            if w in AFFECT_LEXICON or w in CLAUSE_BREAKS:
+                break
+            if w in NEGATIONS:
+                negated = True
+                break
+        if negated:
+            # "not happy" is mildly negative, not the opposite of happy. A negated intensifier
+            # ("not very happy") is a hedge, so it isn't boosted.
+            valence *= -0.5
+        elif i > 0 and tokens[i - 1] in INTENSIFIERS:
+            boost = INTENSIFIERS[tokens[i - 1]]
+            valence = max(-1.0, min(1.0, valence * boost))
+            arousal = max(0.0, min(1.0, arousal * boost))
+        valences.append(valence)
+        arousals.append(arousal)
+
+    valence = round(sum(valences) / len(valences), 3) if valences else 0.0
+    arousal = round(sum(arousals) / len(arousals), 3) if arousals else 0.0
+    risk_flags = [flag for flag, regex in _RISK_REGEX.items() if regex.search(text)]
+
+    return {
+        "sentiment": _sentiment_label(valence),
+        "valence": valence,
+        "arousal": arousal,
+        "risk_flags": risk_flags,
+        "lexicon_hits": len(valences),
+    }
+
+## ----------------- Optional LLM Pass ----------------- ##
+SENTIMENT_LABELS = {"positive", "neutral", "negative"}
+
+# Model wording mapped onto the RISK_PATTERNS categories; anything else stays in the raw output only.
+LLM_RISK_ALIASES = {
+    "self_harm": "self_harm", "suicide": "self_harm", "suicidal": "self_harm",
+    "suicidal_ideation": "self_harm", "self_injury": "self_harm",
+    "hopelessness": "hopelessness", "hopeless": "hopelessness", "despair": "hopelessness",
+    "harm_to_others": "harm_to_others", "violence": "harm_to_others", "homicidal": "harm_to_others",
+    "substance": "substance", "substance_use": "substance", "substance_abuse": "substance", "alcohol": "substance",
+}
+
+def _is_number(value, low, high):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and low <= value <= high
+
+def _clean_llm_result(result):
+    """
+    Keep only model fields that pass validation: a known sentiment label, valence/arousal in range
+    and risk flags mapped onto RISK_PATTERNS categories. The untouched reply is kept under "raw".
+    """
+    if not isinstance(result, dict):
+        return None
+    cleaned = {"raw": result}
+    if result.get("sentiment") in SENTIMENT_LABELS:
+        cleaned["sentiment"] = result["sentiment"]
+    if _is_number(result.get("valence"), -1, 1):
+        cleaned["valence"] = result["valence"]
+    if _is_number(result.get("arousal"), 0, 1):
+        cleaned["arousal"] = result["arousal"]
+
+    flags = result.get("risk_flags")
+    cleaned["risk_flags"] = []
+    if isinstance(flags, list):
+        for flag in flags:
+            if not isinstance(flag, str):
+                continue
+            key = LLM_RISK_ALIASES.get(re.sub(r"[\s-]+", "_", flag.strip().lower()))
+            if key and key not in cleaned["risk_flags"]:
+                cleaned["risk_flags"].append(key)
+    return cleaned
+
+def llm_score_batch(texts, model="mistral"):
+    """
+    Score several turns in one local model call. Returns a list aligned with texts (None for any
+    turn the model skipped or mangled), or None if the call or the reply as a whole is unusable.
+    """
+    # Sent as JSON with ids so multi-line messages can't be mistaken for list items.
+    payload = json.dumps([{"id": i, "text": " ".join(t.split())} for i, t in enumerate(texts)])
+    prompt = (
+        "For each message in the JSON array below, rate the speaker's emotional state. Reply with ONLY a JSON array "
+        "containing one object per message, with keys: id (copied from the message), sentiment (positive/neutral/negative), "
+        "valence (-1 to 1), arousal (0 to 1), risk_flags (list using only: " + ", ".join(RISK_PATTERNS) + "; empty if none).\n\n"
+        + payload
+    )
+    try:
+        response = ollama.chat(model=model, messages=[{"role": "user", "content": prompt}])
+        content = response['message']['content']
+        results = json.loads(content[content.index("["):content.rindex("]") + 1])
+    except Exception:
+        return None
+    if not isinstance(results, list):
+        return None
+
+    by_id = {}
+    for result in results:
+        if isinstance(result, dict) and isinstance(result.get("id"), int) and 0 <= result["id"] < len(texts):
+            by_id.setdefault(result["id"], result)
+    if not by_id:
+        return None
+    return [_clean_llm_result(by_id[i]) if i in by_id else None for i in range(len(texts))]
+
+## ----------------- Background Scoring Pipeline ----------------- ##
+def save_affect(record, AFFECT_FILE=AFFECT_LOG):
+    os.makedirs(os.path.dirname(AFFECT_FILE), exist_ok=True)
+    with open(AFFECT_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+def _log_batch_failure(future):
+    error = future.exception()
+    if error is not None:
+        print(f"Affect scoring batch failed: {error}")
+
+class AffectScorer:
+    """
+    Scores user turns off the chat path. Turns are queued without blocking, gathered into
+    micro-batches by a dispatcher thread and lexicon-scored on a small worker pool. Every record
+    carries the session id and turn id so it can be joined back to the conversation log.
+
+    The optional LLM pass shares the local Ollama server with the chat, so it only runs once no
+    turn has arrived for llm_idle seconds (or on stop), in chunks of llm_batch_size. Its results
+    are appended as a second record for the turn with source "llm".
+    """
+    def __init__(self, batch_size=8, batch_wait=0.5, workers=2, llm_model=None, llm_idle=120,
+                 llm_batch_size=16, affect_file=AFFECT_LOG, session_id=None):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.llm_model = llm_model
+        self.llm_idle = llm_idle
+        self.llm_batch_size = llm_batch_size
+        self.affect_file = affect_file
+        self.session_id = session_id or datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.latest = None
+        self._queue = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vireya-affect")
+        self._write_lock = threading.Lock()
+        self._llm_lock = threading.Lock()
+        self._llm_backlog = []
+        self._pending = 0
+        self._pending_cond = threading.Condition()
+        self._stopped = False
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def enqueue(self, turn_id, speaker, text, timestamp=None):
+        record = {
+            "session_id": self.session_id,
+            "turn_id": turn_id,
+            "timestamp": timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "speaker": speaker,
+            "text": text.strip(),
+        }
+        # Checked and queued under the lock so a turn can't land behind stop()'s sentinel.
+        with self._pending_cond:
+            if self._stopped:
+                return False
+            self._pending += 1
+            self._queue.put_nowait(record)
+        return True
+
+    def latest_feel(self):
+        """Most recent scored sentiment, or neutral if nothing has been scored yet."""
+        return self.latest["sentiment"] if self.latest else "neutral"
+
+    def drain(self, timeout=None):
+        """Wait until every queued turn has been lexicon-scored and written. Returns False on timeout."""
+        with self._pending_cond:
+            return self._pending_cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def _dispatch(self):
+        while True:
+            # With LLM work waiting, a quiet queue means the chat is idle and the model is free.
+            timeout = self.llm_idle if self._llm_backlog else None
+            try:
+                turn = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._submit_llm_backlog()
+                continue
+            if turn is None:
+                break
+            batch = [turn]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    turn = self._queue.get(timeout=self.batch_wait)
+                except queue.Empty:
+                    break
+                if turn is None:
+                    stop = True
+                    break
+                batch.append(turn)
+            self._pool.submit(self._score_batch, batch).add_done_callback(_log_batch_failure)
+            if self.llm_model:
+                self._llm_backlog.extend(batch)
+            if stop:
+                break
+        self._submit_llm_backlog()
+
+    def _submit_llm_backlog(self):
+        if self._llm_backlog:
+            turns, self._llm_backlog = self._llm_backlog, []
+            self._pool.submit(self._llm_pass, turns).add_done_callback(_log_batch_failure)
+
+    def _score_batch(self, batch):
+        try:
+            records = [dict(turn, **score_text(turn["text"]), source="lexicon") for turn in batch]
+            self._save_records(records)
+            with self._write_lock:
+                # Batches can finish out of order; never let an older turn replace a newer one.
+                newest = max(records, key=lambda r: r["turn_id"])
+                if self.latest is None or newest["turn_id"] > self.latest["turn_id"]:
+                    self.latest = newest
+        finally:
+            with self._pending_cond:
+                self._pending -= len(batch)
+                self._pending_cond.notify_all()
+
+    def _llm_pass(self, turns):
+        # One model call at a time, even if two idle flushes overlap.
+        with self._llm_lock:
+            for start in range(0, len(turns), self.llm_batch_size):
+                chunk = turns[start:start + self.llm_batch_size]
+                try:
+                    llm_results = llm_score_batch([turn["text"] for turn in chunk], self.llm_model)
+                except Exception as e:
+                    print(f"Affect LLM pass failed, keeping lexicon scores: {e}")
+                    continue
+                records = []
+                for turn, llm in zip(chunk, llm_results or []):
+                    if llm is None:
+                        continue
+                    lexicon_flags = score_text(turn["text"])["risk_flags"]
+                    # Lexicon flags are kept; the model can only add to them, never clear them.
+                    extra = [f for f in llm["risk_flags"] if f not in lexicon_flags]
+                    record = {key: turn[key] for key in ("session_id", "turn_id", "timestamp", "speaker")}
+                    record.update({k: v for k, v in llm.items() if k in ("sentiment", "valence", "arousal")})
+                    record.update(risk_flags=lexicon_flags + extra, source="llm", llm=llm["raw"])
+                    records.append(record)
+                self._save_records(records)
+
+    def _save_records(self, records):
+        with self._write_lock:
+            for record in records:
+                try:
+                    save_affect(record, self.affect_file)
+                except OSError as e:
+                    print(f"Could not save affect score for turn {record['turn_id']}: {e}")
+
+    def stop(self):
+        """Score anything still queued (including the LLM backlog), then shut the workers down."""
+        with self._pending_cond:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._queue.put(None)
+        self._dispatcher.join()
+        self._pool.shutdown(wait=True)
+
+_scorer = None
+
+def start_affect_scoring(**kwargs):
+    global _scorer
+    if _scorer is None:
+        _scorer = AffectScorer(**kwargs)
+    return _scorer
+
+def enqueue_turn(turn_id, speaker, text, timestamp=None):
+    if _scorer is not None:
+        _scorer.enqueue(turn_id, speaker, text, timestamp)
+
+def latest_feel():
+    return _scorer.latest_feel() if _scorer is not None else "neutral"
+
+def stop_affect_scoring():
+    global _scorer
+    if _scorer is not None:
+        _scorer.stop()
+        _scorer = None
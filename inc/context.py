@@ -8,11 +8,12 @@ import inc.functions as bf
 
 LOG_FILE = "inc/logs/vireya_conversation_log.txt"
 
-def log_conversation(role, text):
+def log_conversation(role, text, timestamp=None, turn=None):
     os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
     with open(LOG_FILE, "a", encoding="utf-8") as f:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        f.write(f"[{timestamp}] {role}: {text.strip()}\n")
+        timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        turn_tag = f" [{turn}]" if turn else ""
+        f.write(f"[{timestamp}]{turn_tag} {role}: {text.strip()}\n")
 
 def summarize_session(history, engine="local"):
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
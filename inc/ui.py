@@ -1,23 +1,34 @@
 import gradio as gr
 import threading
+import os
+from datetime import datetime
 from inc.context import log_conversation, summarize_session, save_context, shutdown_app
 from inc.conversation import conversation_history, get_local_response
+from inc.affect import start_affect_scoring, enqueue_turn, latest_feel
 import inc.functions as bf
 
+# Shared by the conversation log and the affect log so scores can be joined back to their turn.
+SESSION_ID = datetime.now().strftime("%Y%m%d-%H%M%S")
+
 def handle_input(user_input, history, engine, base_prompt, openai_chain=None):
     if engine == "openai" and openai_chain:
         response = openai_chain.predict(input=user_input)
         tag = "[OpenAI]"
     else:
-        response = get_local_response(user_input, base_prompt)
+        response = get_local_response(user_input, base_prompt, feel=latest_feel())
         tag = "[Local]"
 
     character_tagged = f"{tag} Vireya"
 
     conversation_history.append(f"User: {user_input}")
     conversation_history.append(f"{character_tagged}: {response}")
-    log_conversation("James", user_input)
-    log_conversation(character_tagged, response)
+    turn_id = len(conversation_history) // 2
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    turn = f"{SESSION_ID}#{turn_id}"
+    log_conversation("James", user_input, timestamp, turn)
+    log_conversation(character_tagged, response, timestamp, turn)
+    # Scored in the background after the reply is ready; never waits on the scorer.
+    enqueue_turn(turn_id, "James", user_input, timestamp)
 
     history.append((user_input, response))
     return "", history
@@ -29,6 +40,10 @@ def end_chat(history, engine_type):
     return [], ""
 
 def launch_gradio(engine_type, base_prompt, openai_chain=None):
+    # Set VIREYA_AFFECT_MODEL (e.g. "mistral") to add a batched LLM pass on top of the lexicon scores.
+    # It only runs after the chat has gone quiet, so it stays out of the way of replies on Ollama.
+    start_affect_scoring(llm_model=os.getenv("VIREYA_AFFECT_MODEL"), session_id=SESSION_ID)
+
     with gr.Blocks() as demo:
         gr.Markdown(f"## Talk to Vireya (Currently using: **{engine_type}**)")
 
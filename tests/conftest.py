@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app runs from the repo root (inc/ is imported as a namespace package), so tests do too.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,259 @@
+import json
+import time
+import threading
+import pytest
+
+pytest.importorskip("ollama")
+import inc.affect as affect
+
+def _reply(payload):
+    return {"message": {"content": json.dumps(payload)}}
+
+def _read_log(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def _wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail("timed out waiting for the scorer")
+        time.sleep(0.01)
+
+## ----------------- score_text ----------------- ##
+def test_negation_flips_and_softens():
+    assert affect.score_text("I am happy")["sentiment"] == "positive"
+    result = affect.score_text("I am not happy")
+    assert result["sentiment"] == "negative"
+    assert result["valence"] == pytest.approx(-0.4)
+
+def test_negation_stops_at_previous_emotion_word():
+    assert affect.score_text("not happy really exhausted")["valence"] == pytest.approx(-0.62)
+
+def test_negation_stops_at_clause_punctuation():
+    assert affect.score_text("I'm not sure. I'm happy")["sentiment"] == "positive"
+    assert affect.score_text("not bad, feeling great")["sentiment"] == "positive"
+
+def test_curly_apostrophe_negation():
+    assert affect.score_text("I don’t feel good")["sentiment"] == "negative"
+
+def test_negated_intensifier_is_not_stronger_than_plain_negation():
+    plain = affect.score_text("not happy")
+    hedged = affect.score_text("not very happy")
+    assert hedged["valence"] >= plain["valence"]
+    assert hedged["arousal"] <= plain["arousal"]
+
+def test_intensifier_scales_and_clamps():
+    plain = affect.score_text("I am sad")
+    boosted = affect.score_text("I am extremely sad")
+    assert boosted["valence"] < plain["valence"]
+    assert boosted["valence"] >= -1.0
+    assert boosted["arousal"] <= 1.0
+
+def test_no_lexicon_hits_is_neutral():
+    result = affect.score_text("went to the store")
+    assert result == {"sentiment": "neutral", "valence": 0.0, "arousal": 0.0, "risk_flags": [], "lexicon_hits": 0}
+
+@pytest.mark.parametrize("text, flag", [
+    ("I want to kill myself", "self_harm"),
+    ("I just want to die", "self_harm"),
+    ("I don't want to live anymore", "self_harm"),
+    ("I don’t want to wake up", "self_harm"),
+    ("I can't go on", "hopelessness"),
+    ("I can’t go on", "hopelessness"),
+    ("everyone is better off without me", "hopelessness"),
+    ("I've been drinking every night", "substance"),
+])
+def test_risk_patterns(text, flag):
+    assert flag in affect.score_text(text)["risk_flags"]
+
+@pytest.mark.parametrize("text, flag", [
+    ("I'm going to hurt myself tonight", "self_harm"),
+    ("I'm going to hurt him", "harm_to_others"),
+    ("I want to kill someone", "harm_to_others"),
+])
+def test_risk_patterns_require_intent(text, flag):
+    assert flag in affect.score_text(text)["risk_flags"]
+
+@pytest.mark.parametrize("text", [
+    "Rough day but I'm okay",
+    "I hurt myself at the gym",
+    "I am going to die of embarrassment",
+    "I want to die laughing at that video",
+    "my words hurt her feelings",
+    "the fall could kill someone if they're not careful",
+])
+def test_no_risk_flags_on_ordinary_text(text):
+    assert affect.score_text(text)["risk_flags"] == []
+
+## ----------------- llm_score_batch ----------------- ##
+def test_llm_output_is_sanitized(monkeypatch):
+    monkeypatch.setattr(affect.ollama, "chat", lambda **kwargs: _reply([
+        "ok",
+        {"id": 1, "risk_flags": None, "sentiment": "sad", "valence": "high", "arousal": 5},
+        {"id": 2, "risk_flags": "none", "valence": True},
+        {"id": 3, "risk_flags": ["Self-harm", 3, "suicidal ideation"], "sentiment": "negative", "valence": -0.7, "arousal": 0.4},
+        {"id": 4, "risk_flags": ["grief"]},
+    ]))
+    results = affect.llm_score_batch(["a", "b", "c", "d", "e"])
+    assert results[0] is None
+    assert results[1] == {"raw": results[1]["raw"], "risk_flags": []}
+    assert results[2] == {"raw": results[2]["raw"], "risk_flags": []}
+    assert results[3]["risk_flags"] == ["self_harm"]
+    assert (results[3]["sentiment"], results[3]["valence"], results[3]["arousal"]) == ("negative", -0.7, 0.4)
+    assert results[4]["risk_flags"] == []
+    assert results[4]["raw"]["risk_flags"] == ["grief"]
+
+def test_llm_replies_are_matched_by_id(monkeypatch):
+    sent = {}
+
+    def reply_reversed(**kwargs):
+        sent["prompt"] = kwargs["messages"][0]["content"]
+        return _reply([{"id": 1, "sentiment": "negative"}, {"id": 0, "sentiment": "positive"}])
+
+    monkeypatch.setattr(affect.ollama, "chat", reply_reversed)
+    results = affect.llm_score_batch(["feeling great", "line one\n2. line two"])
+    assert [r["sentiment"] for r in results] == ["positive", "negative"]
+    assert "line one 2. line two" in sent["prompt"]
+
+def test_llm_garbage_is_rejected(monkeypatch):
+    monkeypatch.setattr(affect.ollama, "chat", lambda **kwargs: _reply([{"sentiment": "positive"}]))
+    assert affect.llm_score_batch(["a"]) is None
+    monkeypatch.setattr(affect.ollama, "chat", lambda **kwargs: {"message": {"content": "no json here"}})
+    assert affect.llm_score_batch(["a"]) is None
+
+## ----------------- AffectScorer ----------------- ##
+def test_scorer_batches_and_drains(tmp_path):
+    log = tmp_path / "affect.jsonl"
+    scorer = affect.AffectScorer(batch_size=4, batch_wait=0.05, affect_file=str(log), session_id="s1")
+    try:
+        for turn_id in range(1, 11):
+            assert scorer.enqueue(turn_id, "James", "so tired today", "2026-10-19 12:00:00")
+        assert scorer.drain(timeout=5)
+        records = _read_log(log)
+        assert sorted(r["turn_id"] for r in records) == list(range(1, 11))
+        assert all(r["session_id"] == "s1" and r["source"] == "lexicon" for r in records)
+        assert scorer.latest["turn_id"] == 10
+        assert scorer.latest_feel() == "negative"
+        # Still accepting turns after a drain.
+        assert scorer.enqueue(11, "James", "feeling great", "2026-10-19 12:01:00")
+        assert scorer.drain(timeout=5)
+        assert scorer.latest_feel() == "positive"
+    finally:
+        scorer.stop()
+
+def test_stop_scores_queued_turns_then_refuses_new_ones(tmp_path):
+    log = tmp_path / "affect.jsonl"
+    scorer = affect.AffectScorer(batch_size=2, batch_wait=5, affect_file=str(log))
+    for turn_id in range(1, 4):
+        scorer.enqueue(turn_id, "James", "okay")
+    scorer.stop()
+    assert len(_read_log(log)) == 3
+    assert scorer.enqueue(4, "James", "okay") is False
+
+def test_llm_pass_waits_for_idle_and_batches(tmp_path, monkeypatch):
+    calls = []
+
+    def stub(**kwargs):
+        calls.append(kwargs)
+        ids = json.loads(kwargs["messages"][0]["content"].split("\n\n", 1)[1])
+        return _reply([{"id": item["id"], "sentiment": "negative", "risk_flags": ["grief", "hopeless"]} for item in ids])
+
+    monkeypatch.setattr(affect.ollama, "chat", stub)
+    log = tmp_path / "affect.jsonl"
+    scorer = affect.AffectScorer(batch_size=1, batch_wait=0.01, llm_model="stub", llm_idle=0.3, affect_file=str(log))
+    try:
+        scorer.enqueue(1, "James", "I want to die")
+        scorer.enqueue(2, "James", "so tired")
+        assert scorer.drain(timeout=5)
+        # Lexicon scores land straight away; the model hasn't been touched yet.
+        assert [r["source"] for r in _read_log(log)] == ["lexicon", "lexicon"]
+        assert calls == []
+        _wait_until(lambda: len(_read_log(log)) == 4)
+    finally:
+        scorer.stop()
+    assert len(calls) == 1
+    llm_records = [r for r in _read_log(log) if r["source"] == "llm"]
+    assert [r["turn_id"] for r in llm_records] == [1, 2]
+    assert llm_records[0]["risk_flags"] == ["self_harm", "hopelessness"]
+    assert llm_records[0]["llm"]["risk_flags"] == ["grief", "hopeless"]
+    assert llm_records[1]["sentiment"] == "negative"
+
+def test_stop_flushes_llm_backlog(tmp_path, monkeypatch):
+    monkeypatch.setattr(affect.ollama, "chat", lambda **kwargs: _reply([{"id": 0, "sentiment": "positive"}]))
+    log = tmp_path / "affect.jsonl"
+    scorer = affect.AffectScorer(batch_wait=0.01, llm_model="stub", llm_idle=60, affect_file=str(log))
+    scorer.enqueue(1, "James", "feeling great")
+    scorer.stop()
+    assert sorted(r["source"] for r in _read_log(log)) == ["lexicon", "llm"]
+
+def test_bad_llm_output_keeps_lexicon_flags(tmp_path, monkeypatch):
+    monkeypatch.setattr(affect.ollama, "chat", lambda **kwargs: _reply([{"id": 0, "risk_flags": None}]))
+    log = tmp_path / "affect.jsonl"
+    scorer = affect.AffectScorer(batch_wait=0.01, llm_model="stub", llm_idle=0.05, affect_file=str(log))
+    scorer.enqueue(1, "James", "I want to kill myself")
+    scorer.stop()
+    records = _read_log(log)
+    assert [r["risk_flags"] for r in records] == [["self_harm"], ["self_harm"]]
+    assert scorer.latest["turn_id"] == 1
+
+def test_llm_failure_keeps_lexicon_records(tmp_path, monkeypatch, capsys):
+    def boom(**kwargs):
+        raise RuntimeError("model offline")
+    monkeypatch.setattr(affect, "llm_score_batch", lambda texts, model: boom())
+    log = tmp_path / "affect.jsonl"
+    scorer = affect.AffectScorer(batch_wait=0.01, llm_model="stub", llm_idle=0.05, affect_file=str(log))
+    scorer.enqueue(1, "James", "I am sad")
+    scorer.stop()
+    (record,) = _read_log(log)
+    assert record["sentiment"] == "negative"
+    assert record["source"] == "lexicon"
+    assert "model offline" in capsys.readouterr().out
+
+def test_older_batch_finishing_late_does_not_replace_latest(tmp_path, monkeypatch):
+    release = threading.Event()
+    started = threading.Event()
+    real_score = affect.score_text
+
+    def slow_for_first_turn(text):
+        if text == "I am happy":
+            started.set()
+            release.wait(5)
+        return real_score(text)
+
+    monkeypatch.setattr(affect, "score_text", slow_for_first_turn)
+    log = tmp_path / "affect.jsonl"
+    scorer = affect.AffectScorer(batch_size=1, batch_wait=0.01, workers=2, affect_file=str(log))
+    try:
+        scorer.enqueue(1, "James", "I am happy")
+        _wait_until(started.is_set)
+        scorer.enqueue(2, "James", "I am sad")
+        # Turn 2 is scored while turn 1 is still stuck.
+        _wait_until(lambda: scorer.latest is not None)
+        release.set()
+        assert scorer.drain(timeout=5)
+    finally:
+        release.set()
+        scorer.stop()
+    assert scorer.latest["turn_id"] == 2
+    assert scorer.latest_feel() == "negative"
+
+def test_write_failure_does_not_lose_other_records(tmp_path, monkeypatch, capsys):
+    log = tmp_path / "affect.jsonl"
+    real_save = affect.save_affect
+
+    def flaky_save(record, AFFECT_FILE):
+        if record["turn_id"] == 1:
+            raise OSError("disk full")
+        real_save(record, AFFECT_FILE)
+
+    monkeypatch.setattr(affect, "save_affect", flaky_save)
+    scorer = affect.AffectScorer(batch_size=2, batch_wait=1, affect_file=str(log))
+    try:
+        scorer.enqueue(1, "James", "okay")
+        scorer.enqueue(2, "James", "okay")
+        assert scorer.drain(timeout=5)
+    finally:
+        scorer.stop()
+    assert [r["turn_id"] for r in _read_log(log)] == [2]
+    assert "disk full" in capsys.readouterr().out